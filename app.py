@@ -3,7 +3,15 @@ from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import shutil
 import os
-from ocr import main as ocr_main
+import gc
+import random
+import signal
+import socket
+import tempfile
+import time
+import cv2
+import numpy as np
+from ocr import main as ocr_main, get_ocr
 
 app = FastAPI()
 
@@ -15,13 +23,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Set in pre-fork workers so the memory check can ask uvicorn to exit
+worker_server = None
+worker_max_private_mb = None
+
+@app.middleware("http")
+async def recycle_on_memory(request, call_next):
+    response = await call_next(request)
+    if worker_server is not None and worker_max_private_mb and private_memory_mb() > worker_max_private_mb:
+        print(f"Worker {os.getpid()} over {worker_max_private_mb} MB private memory, recycling")
+        worker_server.should_exit = True
+    return response
+
+@app.on_event("startup")
+def load_model():
+    # Load before the first request; a no-op in pre-fork workers, which inherit the master's engine
+    get_ocr()
+
 @app.post("/ocr/")
 async def upload_file(file: UploadFile = File(...)):
     try:
-        output_folder = 'images'
-        os.makedirs(output_folder, exist_ok=True)
+        os.makedirs('images', exist_ok=True)
+        # Per-request folder so concurrent workers don't overwrite each other's pages
+        output_folder = tempfile.mkdtemp(dir='images')
 
-        temp_file_path = os.path.join(output_folder, file.filename)
+        temp_file_path = os.path.join(output_folder, os.path.basename(file.filename))
         
         with open(temp_file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
@@ -29,15 +55,181 @@ async def upload_file(file: UploadFile = File(...)):
         if not os.path.exists(temp_file_path):
             raise HTTPException(status_code=500, detail="File not saved correctly")
 
-        ocr_result = ocr_main(temp_file_path, output_folder)
-
-        os.remove(temp_file_path)
+        try:
+            ocr_result = ocr_main(temp_file_path, output_folder)
+        finally:
+            shutil.rmtree(output_folder, ignore_errors=True)
 
         return JSONResponse(content={"result": ocr_result})
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+#################### PRE-FORK SERVER ##########################
+
+# A worker exiting with an error sooner than this after its fork counts as a
+# failed start and delays the next respawn
+MIN_WORKER_LIFETIME = 5
+MAX_RESPAWN_BACKOFF = 30
+
+def private_memory_mb():
+    """Memory owned by this process alone in MB.
+
+    Model pages still shared copy-on-write with the master are not counted,
+    so this grows only with what the worker itself allocated or touched.
+    """
+    private_kb = 0
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                private_kb += int(line.split()[1])
+    return private_kb / 1024
+
+def warm_up():
+    """Run detection, classification and recognition once so their buffers are allocated before serving."""
+    image = np.full((160, 640, 3), 255, dtype=np.uint8)
+    cv2.putText(image, 'NIK 3171234567890001', (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 0), 2)
+    cv2.putText(image, 'PROVINSI DKI JAKARTA', (10, 130), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 0), 2)
+    get_ocr().ocr(image, cls=True)
+
+def run_worker(sock, max_requests, max_private_mb):
+    """Serve requests on the inherited socket until recycled or stopped."""
+    global worker_server, worker_max_private_mb
+    import uvicorn
+
+    # Drop the master's handlers, uvicorn installs its own for SIGINT/SIGTERM
+    for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, signal.SIG_DFL)
+
+    # Paddle's native thread pools don't survive a fork, so the first
+    # inference happens here in the worker, never in the master
+    warm_up()
+
+    config = uvicorn.Config(app, limit_max_requests=max_requests)
+    worker_server = uvicorn.Server(config)
+    worker_max_private_mb = max_private_mb
+    worker_server.run(sockets=[sock])
+
+def serve_prefork(host='0.0.0.0', port=8844, workers=os.cpu_count(), max_requests=None, max_private_mb=None):
+    """Load the model once, then fork workers that share it copy-on-write.
+
+    Workers exit after about max_requests requests (with up to 10% jitter so
+    they don't all recycle together) or once their private memory passes
+    max_private_mb, and are replaced by a fresh fork of the master. SIGHUP
+    replaces workers one at a time; SIGTERM/SIGINT shut down gracefully.
+    """
+    # Build the predictors without running them: the weights are shared with
+    # every worker, the inference threads start in each worker after the fork
+    get_ocr()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    # Keep the GC from writing to (and so copying) objects shared with workers
+    gc.collect()
+    gc.freeze()
+
+    children = {}  # pid -> spawn time
+    retiring = set()  # Workers asked to stop by a reload, reaped without respawn
+    pending_reload = []  # Workers still to be replaced by the current reload
+    state = {'stopping': False, 'reload': False}
+    backoff = 0
+    next_spawn = 0
+
+    def spawn():
+        limit = max_requests + random.randint(0, max_requests // 10) if max_requests else None
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                run_worker(sock, limit, max_private_mb)
+                code = 0
+            except BaseException as e:
+                print(f"Worker {os.getpid()} failed: {e!r}")
+            finally:
+                os._exit(code)
+        children[pid] = time.monotonic()
+        return pid
+
+    def handle_stop(signum, frame):
+        state['stopping'] = True
+
+    def handle_reload(signum, frame):
+        state['reload'] = True
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+    signal.signal(signal.SIGHUP, handle_reload)
+
+    for _ in range(workers):
+        spawn()
+    print(f"Master {os.getpid()} serving on {host}:{port} with {workers} workers")
+
+    while not state['stopping']:
+        if state['reload']:
+            state['reload'] = False
+            pending_reload = list(children)
+
+        # Rolling reload: replace one worker and wait for the old one to be
+        # reaped before the next, so at most one extra process exists
+        if pending_reload and not retiring:
+            pid = pending_reload.pop(0)
+            if pid in children:
+                spawn()
+                del children[pid]
+                retiring.add(pid)
+                os.kill(pid, signal.SIGTERM)
+
+        if len(children) < workers and time.monotonic() >= next_spawn:
+            spawn()
+            continue
+
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid = 0
+        if pid in children:
+            lifetime = time.monotonic() - children.pop(pid)
+            if os.waitstatus_to_exitcode(status) != 0 and lifetime < MIN_WORKER_LIFETIME:
+                backoff = min(max(backoff * 2, 1), MAX_RESPAWN_BACKOFF)
+                print(f"Worker {pid} failed on start, respawning in {backoff}s")
+                next_spawn = time.monotonic() + backoff
+            else:
+                backoff = 0
+            continue
+        if pid in retiring:
+            retiring.discard(pid)
+            continue
+        time.sleep(0.5)
+
+    for pid in children:
+        os.kill(pid, signal.SIGTERM)
+    for pid in list(children) + list(retiring):
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+    sock.close()
+
 if __name__ == "__main__":
+    import argparse
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8844)
+
+    parser = argparse.ArgumentParser(description="ID card OCR API")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8844)
+    parser.add_argument('--workers', type=int, default=1, help="pre-fork workers sharing one model copy")
+    parser.add_argument('--max-requests', type=int, default=None, help="recycle a worker after about this many requests")
+    parser.add_argument('--max-private-mb', type=float, default=None, help="recycle a worker once its private (unshared) memory exceeds this")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        serve_prefork(args.host, args.port, args.workers, args.max_requests, args.max_private_mb)
+    else:
+        if args.max_requests is not None or args.max_private_mb is not None:
+            parser.error("--max-requests and --max-private-mb need --workers > 1")
+        uvicorn.run(app, host=args.host, port=args.port)
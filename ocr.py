@@ -1,9 +1,35 @@
 from paddleocr import PaddleOCR
+from paddleocr.tools.infer.predict_system import sorted_boxes
+from paddleocr.tools.infer.utility import get_rotate_crop_image
 from pdf2image import convert_from_path
 import re, os, json
 from collections import Counter
-
-ocr = PaddleOCR(use_angle_cls=True, lang='en')
+import cv2
+import numpy as np
+
+ocr = None  # Built on first use, see get_ocr
+
+def get_ocr():
+    """Return the shared PaddleOCR engine, building it on first use."""
+    global ocr
+    if ocr is None:
+        ocr = PaddleOCR(use_angle_cls=True, lang='en')
+    return ocr
+
+# Page orientation is estimated from a handful of the largest text lines
+ORIENTATION_SAMPLE_LINES = 8
+# Fewer usable lines than this and the page is not used for an estimate
+ORIENTATION_MIN_LINES = 4
+# Boxes less elongated than this say nothing about the text direction
+ORIENTATION_MIN_ASPECT = 2.0
+# Below this agreement an orientation estimate is not trusted
+ORIENTATION_MIN_CONFIDENCE = 0.8
+
+ROTATIONS = {
+    90: cv2.ROTATE_90_CLOCKWISE,
+    180: cv2.ROTATE_180,
+    270: cv2.ROTATE_90_COUNTERCLOCKWISE,
+}
 
 def detect_document_type(words):
     ktp_keywords = ['NIK', 'PROVINSI', 'KABUPATEN', 'NAMA']
@@ -39,16 +65,144 @@ def pdf_to_images(pdf_path, output_folder):
 
     return image_paths
 
+def rotate_image(image, angle):
+    """Rotate image clockwise by 0, 90, 180 or 270 degrees."""
+    if angle == 0:
+        return image
+    return cv2.rotate(image, ROTATIONS[angle])
+
+def rotate_boxes(boxes, angle, width, height):
+    """Map detected boxes onto the image rotated clockwise by angle.
+
+    Point order is rolled as well so every box still starts at its top-left
+    corner, which is what get_rotate_crop_image expects.
+    """
+    rotated = []
+    for box in boxes:
+        x, y = box[:, 0], box[:, 1]
+        if angle == 90:
+            points = np.stack([height - 1 - y, x], axis=1)
+        elif angle == 180:
+            points = np.stack([width - 1 - x, height - 1 - y], axis=1)
+        elif angle == 270:
+            points = np.stack([y, width - 1 - x], axis=1)
+        else:
+            points = box
+        rotated.append(np.roll(points, angle // 90, axis=0))
+    return np.array(rotated, dtype=np.float32)
+
+def estimate_page_layout(dt_boxes):
+    """Tell whether the page is turned sideways from the shape of its text boxes.
+
+    Returns (sideways, confidence), confidence being the share of clearly
+    elongated boxes that agree with the majority, or None when there are too
+    few of them to tell.
+    """
+    tall = wide = 0
+    for box in dt_boxes:
+        width = np.linalg.norm(box[0] - box[1])
+        height = np.linalg.norm(box[0] - box[3])
+        if height >= width * ORIENTATION_MIN_ASPECT:
+            tall += 1
+        elif width >= height * ORIENTATION_MIN_ASPECT:
+            wide += 1
+
+    if tall + wide < ORIENTATION_MIN_LINES:
+        return None
+    return tall > wide, max(tall, wide) / (tall + wide)
+
+def estimate_page_flip(image, dt_boxes, angle):
+    """Estimate whether the page, once rotated by angle, is upside down.
+
+    Only the largest few lines go through the angle classifier. Returns
+    (flipped, confidence) from the mean probability of the lines being
+    flipped, or None when too few lines were sampled.
+    """
+    boxes = rotate_boxes(dt_boxes, angle, image.shape[1], image.shape[0])
+    rotated = rotate_image(image, angle)
+    areas = [np.linalg.norm(box[0] - box[1]) * np.linalg.norm(box[0] - box[3]) for box in boxes]
+    sample = np.argsort(areas)[::-1][:ORIENTATION_SAMPLE_LINES]
+    crops = [get_rotate_crop_image(rotated, boxes[i]) for i in sample]
+    if len(crops) < ORIENTATION_MIN_LINES:
+        return None
+
+    _, cls_res, _ = get_ocr().text_classifier(crops)
+    # P(180) per line: the score for a '180' label, its complement for '0'
+    p_flipped = sum(score if label == '180' else 1 - score for label, score in cls_res) / len(cls_res)
+    return p_flipped > 0.5, max(p_flipped, 1 - p_flipped)
+
+def estimate_page_orientation(image, dt_boxes):
+    """Decide how to orient a page from its already detected text boxes.
+
+    Returns (angle, use_cls): the clockwise rotation to apply and whether the
+    per-line angle classifier is still needed, or None when the page has too
+    few lines to judge. Sideways vs. upright and the 0/180 flip are trusted
+    separately, so a sideways page is still turned by 90 when only the flip
+    is uncertain.
+    """
+    layout = estimate_page_layout(dt_boxes)
+    if layout is None:
+        return None
+    sideways, layout_confidence = layout
+    if layout_confidence < ORIENTATION_MIN_CONFIDENCE:
+        return 0, True
+
+    angle = 90 if sideways else 0
+    flip = estimate_page_flip(image, dt_boxes, angle)
+    if flip is None:
+        return None
+    flipped, flip_confidence = flip
+    if flip_confidence < ORIENTATION_MIN_CONFIDENCE:
+        return angle, True
+
+    return (angle + 180) % 360 if flipped else angle, False
+
+def recognize_page(image, dt_boxes, angle, use_cls):
+    """Recognize detected lines of a page rotated by angle, in reading order.
+
+    Mirrors PaddleOCR's own det/cls/rec pipeline but reuses the boxes that were
+    already detected for the orientation estimate.
+    """
+    if len(dt_boxes) == 0:
+        return []
+
+    boxes = sorted_boxes(rotate_boxes(dt_boxes, angle, image.shape[1], image.shape[0]))
+    rotated = rotate_image(image, angle)
+    crops = [get_rotate_crop_image(rotated, box) for box in boxes]
+
+    if use_cls:
+        crops, _, _ = get_ocr().text_classifier(crops)
+    rec_res, _ = get_ocr().text_recognizer(crops)
+
+    drop_score = get_ocr().drop_score
+    return [[box.tolist(), (text, score)] for box, (text, score) in zip(boxes, rec_res) if score >= drop_score]
+
 def extract_text_from_images(image_paths):
-    """Extract text from list of image paths and return as a list of words, removing colons and spaces."""
+    """Extract text from list of image paths and return as a list of words, removing colons and spaces.
+
+    The orientation from the first page with enough text is reused for the rest of the document.
+    """
     all_words = []
+    orientation = None  # Cached (angle, use_cls) for all pages of this document
 
     for image_index, image_path in enumerate(image_paths):
-        ocr_result = ocr.ocr(image_path, cls=True)
+        image = cv2.imread(image_path)
+        if image is None:
+            raise ValueError(f"Could not read image: {image_path}")
+
+        dt_boxes, _ = get_ocr().text_detector(image)
+        if dt_boxes is None:
+            dt_boxes = []
+
+        if orientation is None:
+            orientation = estimate_page_orientation(image, dt_boxes)
+        angle, use_cls = orientation if orientation is not None else (0, True)
+
+        ocr_result = [recognize_page(image, dt_boxes, angle, use_cls)]
         
         # Extract and collect text from OCR result
         for line_index, line in enumerate(ocr_result):
-            for word_index, word_info in enumerate(line):
+            for word_index, word_info in enumerate(line or []):
                 word = word_info[1][0]  # Get the recognized word
                 cleaned_word = word.replace(':', '').strip()  # Remove colons and strip spaces
                 if cleaned_word:  # Ensure non-empty word is added